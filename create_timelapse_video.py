@@ -1,63 +1,110 @@
+import asyncio
 import json
 import os
-import glob
+import re
 import yaml
 import logging
 import subprocess
+import sys
+from dataclasses import dataclass, fields, replace
+from functools import lru_cache
 from datetime import datetime, timedelta
 from argparse import ArgumentParser
-from colored import fg, attr
 from tqdm import tqdm
 
-# Load config.yaml
-with open('config.yaml', 'r') as file:
-    config = yaml.safe_load(file)
-
-# Ensure the log directory exists
-log_folder = config['log']['folder']
-if not os.path.exists(log_folder):
-    os.makedirs(log_folder)
-
-# Set up logging based on config (file logging)
-logging.basicConfig(
-    filename=os.path.join(log_folder, config['log']['filename']),
-    level=config['log']['level'],
-    format=config['log']['format'],
-    datefmt=config['log']['datefmt']
-)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Resolved video_output settings, read once instead of walking the config dict per use
+@dataclass(frozen=True, slots=True)
+class VideoCfg:
+    folder: str
+    folder_structure: str
+    codec: str
+    extension: str
+    crf: int
+    preset: str
+    max_bitrate: str
+    min_bitrate: str
+    buffer_size: str
+    video_size: str
+    fps: int
+    video_filter: str
+    threads: int = 0
+    hwaccel: str | None = None
+    hw_codec: str | None = None
+    vaapi_device: str = '/dev/dri/renderD128'
+
+    # Encoder actually used: the hardware codec when configured and available, otherwise the software codec
+    @property
+    def encoder(self):
+        return self.hw_codec or self.codec
+
+    @classmethod
+    def from_config(cls, config):
+        video_output = config['video_output']
+        return cls(**{f.name: video_output[f.name] for f in fields(cls) if f.name in video_output})
+
+# Codecs that need an explicit pixel format
+PIX_FMT_CODECS = frozenset({'h264_v4l2m2m', 'libx264', 'libx265'})
+NV12_CODECS = frozenset({'h264_nvenc', 'hevc_nvenc', 'h264_videotoolbox', 'hevc_videotoolbox'})
 
 logger = logging.getLogger(__name__)
 
-# Console logger
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
-console_formatter = logging.Formatter(config['log']['format'], config['log']['datefmt'])
-console_handler.setFormatter(console_formatter)
-logger.addHandler(console_handler)
+# Set up file and console logging based on config
+def setup_logging(config):
+    # Ensure the log directory exists
+    log_folder = config['log']['folder']
+    if not os.path.exists(log_folder):
+        os.makedirs(log_folder)
+
+    # Set up logging based on config (file logging)
+    logging.basicConfig(
+        filename=os.path.join(log_folder, config['log']['filename']),
+        level=config['log']['level'],
+        format=config['log']['format'],
+        datefmt=config['log']['datefmt']
+    )
+
+    # Console logger
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.INFO)
+    console_formatter = logging.Formatter(config['log']['format'], config['log']['datefmt'])
+    console_handler.setFormatter(console_formatter)
+    logger.addHandler(console_handler)
 
 # Save metadata to JSON file
-def save_metadata_to_json(output_path, metadata):
+def save_metadata_to_json(output_path, metadata, config):
     json_filename = output_path.replace(config['filename']['extension'], '.json')
-    with open(json_filename, 'w') as json_file:
-        json.dump(metadata, json_file, indent=4)
+    if orjson:
+        with open(json_filename, 'wb') as json_file:
+            json_file.write(orjson.dumps(metadata, option=orjson.OPT_INDENT_2))
+    else:
+        with open(json_filename, 'w') as json_file:
+            json.dump(metadata, json_file, indent=4)
     log_with_color(f"Metadata saved to {json_filename}", "info", "green")
 
 
+# Characters replaced when sanitizing metadata for filenames
+_SAN_TABLE = str.maketrans({' ': '_', ':': '_', '/': '_'})
+
 # Sanitize metadata for filenames
 def sanitize_for_filename(value):
-    return str(value).replace(' ', '_').replace(':', '_').replace('/', '_')
+    return str(value).translate(_SAN_TABLE)
 
 # Append metadata to filename if required
-def append_metadata_to_filename(base_filename):
+def append_metadata_to_filename(base_filename, config, vcfg):
     metadata = []
 
     if config['filename']['append_metadata']:
-        metadata.append(f"filter-{sanitize_for_filename(config['video_output']['video_filter'])}")
-        metadata.append(f"codec-{sanitize_for_filename(config['video_output']['codec'])}")
-        metadata.append(f"crf-{sanitize_for_filename(config['video_output']['crf'])}")
-        metadata.append(f"preset-{sanitize_for_filename(config['video_output']['preset'])}")
-        metadata.append(f"bitrate-{sanitize_for_filename(config['video_output']['max_bitrate'])}")
-        metadata.append(f"size-{sanitize_for_filename(config['video_output']['video_size'])}")
+        metadata.append(f"filter-{sanitize_for_filename(vcfg.video_filter)}")
+        metadata.append(f"codec-{sanitize_for_filename(vcfg.encoder)}")
+        metadata.append(f"crf-{sanitize_for_filename(vcfg.crf)}")
+        metadata.append(f"preset-{sanitize_for_filename(vcfg.preset)}")
+        metadata.append(f"bitrate-{sanitize_for_filename(vcfg.max_bitrate)}")
+        metadata.append(f"size-{sanitize_for_filename(vcfg.video_size)}")
 
     # Join metadata with underscores and append to the filename
     if metadata:
@@ -66,78 +113,338 @@ def append_metadata_to_filename(base_filename):
 
     return base_filename
 
+# Below this many frames the progress bar costs more than the encode itself
+PROGRESS_MIN_FRAMES = 50
+
+# Above this many frames a software encode is split into parts encoded in parallel
+CHUNK_THRESHOLD = 10000
+MAX_CHUNKS = 8
+
+# Only CPU-bound software encoders gain from parallel parts; hardware encoders share one fixed-function block
+CHUNK_CODECS = frozenset({'libx264', 'libx265'})
+
+# Filters that look at neighbouring frames; each part would restart their window and leave seams at part boundaries
+TEMPORAL_FILTERS = frozenset({'deflicker', 'tmix', 'tblend', 'minterpolate', 'framerate', 'atadenoise', 'hqdn3d'})
+
+# Matches the frame counter in FFmpeg's -progress output
+FRAME_RE = re.compile(rb'^frame=\s*(\d+)')
+
 # Progress parser helper function
-def parse_ffmpeg_progress(ffmpeg_process, total_frames):
-    progress_bar = tqdm(total=total_frames, desc="Encoding Progress", unit="frame")
+async def parse_ffmpeg_progress(ffmpeg_process, total_frames, position=0):
+    progress_bar = tqdm(total=total_frames, desc="Encoding Progress", unit="frame", position=position)
+    await read_ffmpeg_frames(ffmpeg_process, lambda frame: progress_bar.update(frame - progress_bar.n))
+    progress_bar.close()
+
+# Read FFmpeg's -progress output and report each frame count to on_frame
+async def read_ffmpeg_frames(ffmpeg_process, on_frame):
+    tail = b''
 
+    # Read in large chunks so FFmpeg never blocks on a full pipe
     while True:
-        line = ffmpeg_process.stdout.readline().decode("utf-8").strip()
-        if not line:
+        chunk = await ffmpeg_process.stdout.read(65536)
+        if not chunk:
             break
-        if line.startswith("frame="):
-            frame = int(line.split("=")[1].strip())
-            progress_bar.update(frame - progress_bar.n)
-
-    progress_bar.close()
+        lines = (tail + chunk).split(b'\n')
+        tail = lines.pop()
+        for line in lines:
+            # Cheap first-byte check skips out_time, bitrate, etc. before the regex
+            if not line.startswith(b'f'):
+                continue
+            match = FRAME_RE.match(line)
+            if match:
+                on_frame(int(match.group(1)))
+
+# ANSI color codes for log_with_color, left empty when the console is not a terminal (pipes, journald)
+_ANSI = {'red': '\x1b[31m', 'green': '\x1b[32m', 'blue': '\x1b[34m', 'cyan': '\x1b[36m', 'magenta': '\x1b[35m', 'white': '\x1b[37m'}
+_RESET = '\x1b[0m'
+if not sys.stderr.isatty():
+    _ANSI = {color: '' for color in _ANSI}
+    _RESET = ''
+_LEVELS = {'debug': logging.DEBUG, 'info': logging.INFO, 'error': logging.ERROR, 'warning': logging.WARNING}
 
 # Helper function to log with color to console
 def log_with_color(message, level="info", color="white"):
-    color_code = fg(color)
-    reset = attr('reset')
-    if level == "info":
-        logger.info(f"{color_code}{message}{reset}")
-    elif level == "error":
-        logger.error(f"{color_code}{message}{reset}")
-    elif level == "warning":
-        logger.warning(f"{color_code}{message}{reset}")
-
-# Get image folder and file pattern based on date and config
-def get_image_files(date):
+    lvl = _LEVELS.get(level)
+    if lvl is None or not logger.isEnabledFor(lvl):
+        return
+    # Let logging do the formatting, only once a record is actually emitted
+    logger.log(lvl, "%s%s%s", _ANSI[color], message, _RESET)
+
+# Get image files for a date, optionally limited to a modification time window (timestamps, inclusive)
+def get_image_files(date, config, min_mtime=None, max_mtime=None):
     folder_structure = config['image_input']['folder_structure']
     folder = os.path.join(config['image_input']['folder'], date.strftime(folder_structure))
-    search_pattern = os.path.join(folder, f"*{config['image_input']['extension']}")
-    return sorted(glob.glob(search_pattern))
+    extension = config['image_input']['extension']
 
-# Create a temporary file list for FFmpeg input
-def create_ffmpeg_file_list(images):
-    temp_list_file = 'ffmpeg_images.txt'
-    with open(temp_list_file, 'w') as f:
-        for image in images:
-            f.write(f"file '{image}'\n")
-    return temp_list_file
+    # Single directory pass; DirEntry caches its stat() result
+    paths = []
+    try:
+        with os.scandir(folder) as it:
+            for entry in it:
+                # Match glob('*.ext'): skip dotfiles (e.g. macOS ._ files) and directories
+                if entry.name.startswith('.') or not entry.name.endswith(extension) or not entry.is_file():
+                    continue
+                if min_mtime is not None or max_mtime is not None:
+                    mtime = entry.stat().st_mtime
+                    if min_mtime is not None and mtime < min_mtime:
+                        continue
+                    if max_mtime is not None and mtime > max_mtime:
+                        continue
+                paths.append(entry.path)
+    except FileNotFoundError:
+        return []
+
+    # All paths share the folder prefix, so sorting paths orders by filename
+    return sorted(paths)
+
+# Detect a numbered image sequence (image_input.sequence_pattern, e.g. 'img_%06d.jpg') that FFmpeg's image2 demuxer can read directly
+def find_image_sequence(images, config):
+    sequence_pattern = config['image_input'].get('sequence_pattern')
+    if not sequence_pattern:
+        return None
+
+    # All images must live in one folder (morning-to-morning may span two)
+    folder = os.path.dirname(images[0])
+    name_re = re.compile(re.sub(r'%0?\d*d', lambda _: r'(\d+)', re.escape(sequence_pattern)) + '$')
+
+    numbers = []
+    for image in images:
+        name = os.path.basename(image)
+        match = name_re.match(name)
+        if not match or os.path.dirname(image) != folder:
+            return None
+        number = int(match.group(1))
+        # The name must be exactly what FFmpeg will open, including the printf zero padding
+        if sequence_pattern % number != name:
+            return None
+        numbers.append(number)
+
+    # Numbers must be consecutive, otherwise image2 would stop at the first gap
+    start_number = numbers[0]
+    if numbers != list(range(start_number, start_number + len(numbers))):
+        return None
+
+    return os.path.join(folder, sequence_pattern), start_number, len(numbers)
+
+# Write the concat list to an anonymous in-memory file that FFmpeg can open via /dev/fd (Linux only)
+def create_ffmpeg_file_list(payload):
+    fd = os.memfd_create('ffconcat')
+    os.write(fd, payload)
+    os.lseek(fd, 0, os.SEEK_SET)
+    return fd
+
+# Prepare a concat list for FFmpeg: a memfd on Linux, or a payload for FFmpeg's stdin elsewhere
+def open_concat_list(paths):
+    payload = b''.join(f"file '{path}'\n".encode() for path in paths)
+    if hasattr(os, 'memfd_create'):
+        fd = create_ffmpeg_file_list(payload)
+        return f"/dev/fd/{fd}", fd, None
+    return 'pipe:0', None, payload
+
+# Start FFmpeg and hand it the concat list (if any)
+async def start_ffmpeg(ffmpeg_command, list_fd=None, list_payload=None, show_progress=False):
+    # Only build the joined command line when debug logging is on
+    if logger.isEnabledFor(logging.DEBUG):
+        log_with_color(f"Running FFmpeg command: {' '.join(ffmpeg_command)}", "debug", "cyan")
+
+    stdin = subprocess.PIPE if list_payload is not None else subprocess.DEVNULL
+    stdout = subprocess.PIPE if show_progress else subprocess.DEVNULL
+    pass_fds = [list_fd] if list_fd is not None else []
+    try:
+        process = await asyncio.create_subprocess_exec(*ffmpeg_command, stdin=stdin, stdout=stdout, stderr=subprocess.STDOUT, pass_fds=pass_fds)
+    finally:
+        # FFmpeg holds its own copy of the descriptor
+        if list_fd is not None:
+            os.close(list_fd)
+
+    if list_payload is not None:
+        try:
+            process.stdin.write(list_payload)
+            await process.stdin.drain()
+            process.stdin.close()
+        except Exception:
+            # FFmpeg exited before reading the list; reap it before the caller loses track of it
+            if process.returncode is None:
+                process.kill()
+            await process.wait()
+            raise
+
+    return process
+
+# Encoders supported by the local FFmpeg build, probed once per process
+@lru_cache(maxsize=None)
+def available_encoders():
+    try:
+        result = subprocess.run(['ffmpeg', '-hide_banner', '-encoders'], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return frozenset()
+    encoders = set()
+    for line in result.stdout.splitlines():
+        parts = line.split()
+        # Encoder lines look like " V....D libx264  ..."; skip the legend (" V..... = Video")
+        if len(parts) > 2 and parts[1] != '=':
+            encoders.add(parts[1])
+    return frozenset(encoders)
+
+# Resolve the hardware codec to use: the configured one if this FFmpeg build can encode with it, otherwise None (software codec)
+def select_hw_codec(vcfg):
+    if not vcfg.hw_codec:
+        return None
+    if vcfg.hw_codec in available_encoders():
+        log_with_color(f"Using hardware encoder: {vcfg.hw_codec}", "info", "cyan")
+        return vcfg.hw_codec
+    log_with_color(f"Hardware encoder {vcfg.hw_codec} not available, falling back to {vcfg.codec}", "warning", "magenta")
+    return None
 
 # Build FFmpeg command
-def build_ffmpeg_command(image_list_file, output_path):
+def build_ffmpeg_command(image_list_file, output_path, vcfg, sequence=None, extra_args=()):
     ffmpeg_command = [
-        # 'ffmpeg', '-y', '-r', str(config['video_output']['fps']),
+        # 'ffmpeg', '-y', '-r', str(vcfg.fps),
         'ffmpeg', '-y', '-loglevel', 'error', '-hide_banner',  # Suppress warnings and banner
-        '-f', 'concat', '-safe', '0', '-i', image_list_file,
-        '-vf', config['video_output']['video_filter'],
-        '-c:v', config['video_output']['codec'],
-        '-crf', str(config['video_output']['crf']),
-        '-preset', config['video_output']['preset'],
-        '-b:v', config['video_output']['max_bitrate'],
-        '-minrate', config['video_output']['min_bitrate'],
-        '-maxrate', config['video_output']['max_bitrate'],
-        '-bufsize', config['video_output']['buffer_size'],
-        '-s', config['video_output']['video_size'],
     ]
 
+    encoder = vcfg.encoder
+    vaapi = encoder.endswith('_vaapi')
+
+    # Optional hardware accelerated decoding (e.g. 'auto', 'vaapi', 'videotoolbox', 'cuda')
+    if vcfg.hwaccel:
+        ffmpeg_command.extend(['-hwaccel', vcfg.hwaccel])
+
+    # VAAPI encoders need the render device to upload frames to
+    if vaapi:
+        ffmpeg_command.extend(['-vaapi_device', vcfg.vaapi_device])
+
+    if sequence:
+        # Numbered sequence: image2 demuxer, limited to the selected frames
+        # No -framerate, so the input rate matches the concat demuxer's default (25) and the output is the same either way
+        input_pattern, start_number, frame_count = sequence
+        ffmpeg_command.extend([
+            '-start_number', str(start_number), '-i', input_pattern,
+            '-frames:v', str(frame_count),
+        ])
+    else:
+        ffmpeg_command.extend(['-f', 'concat', '-safe', '0', '-i', image_list_file])
+
+    video_filter = vcfg.video_filter
+    if vaapi:
+        # Scale in software, then push NV12 frames to GPU memory
+        gpu_filters = f"scale={vcfg.video_size.replace('x', ':')},format=nv12,hwupload"
+        video_filter = ','.join(part for part in (video_filter, gpu_filters) if part)
+
+    ffmpeg_command.extend(['-vf', video_filter, '-c:v', encoder])
+
+    # Rate control: NVENC uses constant quality instead of CRF, VAAPI/VideoToolbox are driven by the bitrates below
+    if encoder.endswith('_nvenc'):
+        ffmpeg_command.extend(['-rc', 'vbr', '-cq', str(vcfg.crf), '-preset', vcfg.preset])
+    elif not vaapi and not encoder.endswith('_videotoolbox'):
+        ffmpeg_command.extend(['-crf', str(vcfg.crf), '-preset', vcfg.preset])
+
+    ffmpeg_command.extend([
+        '-threads', str(vcfg.threads),  # 0 lets FFmpeg pick based on CPU count
+        '-b:v', vcfg.max_bitrate,
+        '-minrate', vcfg.min_bitrate,
+        '-maxrate', vcfg.max_bitrate,
+        '-bufsize', vcfg.buffer_size,
+    ])
+
+    # Frames are already scaled on the GPU path
+    if not vaapi:
+        ffmpeg_command.extend(['-s', vcfg.video_size])
+
     # Apply pixel format for specific codecs
-    if config['video_output']['codec'] in ['h264_v4l2m2m', 'libx264', 'libx265']:
+    if encoder in PIX_FMT_CODECS:
         ffmpeg_command.append('-pix_fmt')
         ffmpeg_command.append('yuv420p')
     
         # Set color range explicitly to full or limited (depends on your use case)
         ffmpeg_command.append('-color_range')
         ffmpeg_command.append('tv')  # Options: 'tv' (limited range) or 'pc' (full range)
+    elif encoder in NV12_CODECS:
+        # Hardware encoders expect NV12 input (VAAPI gets it from the filter chain)
+        ffmpeg_command.append('-pix_fmt')
+        ffmpeg_command.append('nv12')
 
+    ffmpeg_command.extend(extra_args)
     ffmpeg_command.append(output_path)
     
     return ffmpeg_command
 
+# Number of parallel parts for an encode: one per thread in its budget (all cores when threads is 0), at most MAX_CHUNKS
+def chunk_count(vcfg):
+    return min(vcfg.threads or os.cpu_count() or 1, MAX_CHUNKS)
+
+# Splitting only pays off for software encoders with more than one part, and is unsafe with temporal filters
+def can_encode_in_chunks(images, vcfg):
+    if len(images) <= CHUNK_THRESHOLD or vcfg.encoder not in CHUNK_CODECS or chunk_count(vcfg) < 2:
+        return False
+    # Strip input labels, options and the @instance suffix to get the bare filter name
+    filter_names = {re.sub(r'^(\[[^\]]*\])*', '', f).split('=', 1)[0].split('@', 1)[0].strip() for f in re.split(r'[,;]', vcfg.video_filter)}
+    return not filter_names & TEMPORAL_FILTERS
+
+# Encode the images in parallel parts, then join them without re-encoding
+async def encode_in_chunks(images, output_path, config, vcfg, position=0):
+    # Split this encode's thread budget between the parts
+    thread_budget = vcfg.threads or os.cpu_count() or 1
+    chunk_size = -(-len(images) // chunk_count(vcfg))
+    chunks = [images[i:i + chunk_size] for i in range(0, len(images), chunk_size)]
+    log_with_color(f"Encoding {len(images)} images in {len(chunks)} parallel parts", "info", "cyan")
+
+    # Start every part on a keyframe
+    part_vcfg = replace(vcfg, threads=max(1, thread_budget // len(chunks)))
+    keyframe_args = ['-g', str(vcfg.fps), '-force_key_frames', 'expr:eq(n,0)']
+
+    root, extension = os.path.splitext(output_path)
+    part_paths = [f"{root}.part{i:02d}{extension}" for i in range(len(chunks))]
+
+    # One progress bar for the whole date, fed by the frame counts of all parts
+    progress_bar = tqdm(total=len(images), desc="Encoding Progress", unit="frame", position=position)
+    part_frames = [0] * len(chunks)
+
+    def update_progress(part, frame):
+        part_frames[part] = frame
+        progress_bar.update(sum(part_frames) - progress_bar.n)
+
+    processes = []
+    try:
+        for chunk, part_path in zip(chunks, part_paths):
+            sequence = find_image_sequence(chunk, config)
+            image_list_file, list_fd, list_payload = (None, None, None) if sequence else open_concat_list(chunk)
+            ffmpeg_command = build_ffmpeg_command(image_list_file, part_path, part_vcfg, sequence, keyframe_args)
+            ffmpeg_command.extend(['-progress', '-', '-nostats'])
+            processes.append(await start_ffmpeg(ffmpeg_command, list_fd, list_payload, show_progress=True))
+
+        await asyncio.gather(*(
+            read_ffmpeg_frames(process, lambda frame, part=part: update_progress(part, frame))
+            for part, process in enumerate(processes)
+        ))
+        await asyncio.gather(*(process.wait() for process in processes))
+        if any(process.returncode != 0 for process in processes):
+            raise RuntimeError("FFmpeg failed to encode one or more parts")
+
+        # Stream-copy the parts into the final video
+        parts_list_file, list_fd, list_payload = open_concat_list(part_paths)
+        ffmpeg_command = [
+            'ffmpeg', '-y', '-loglevel', 'error', '-hide_banner',
+            '-f', 'concat', '-safe', '0', '-i', parts_list_file,
+            '-c', 'copy', output_path,
+        ]
+        process = await start_ffmpeg(ffmpeg_command, list_fd, list_payload)
+        if await process.wait() != 0:
+            raise RuntimeError("FFmpeg failed to join the encoded parts")
+    finally:
+        progress_bar.close()
+
+        # Stop any part still running after a failure, then remove the intermediates
+        for process in processes:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+        for part_path in part_paths:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
 # Create a timelapse video
-def create_timelapse(date):
+async def create_timelapse(date, config, vcfg, test_amount=None, position=0):
     try:
         start_time = datetime.now()
         log_with_color(f"Creating timelapse for date: {date}", "info", "green")
@@ -152,55 +459,66 @@ def create_timelapse(date):
             start_time_morning = datetime.combine(date, morning_time)
             end_time_morning = start_time_morning + timedelta(days=1)
 
+            # Compare raw st_mtime floats against these instead of building a datetime per image
+            start_ts = start_time_morning.timestamp()
+            end_ts = end_time_morning.timestamp()
+
             # Get images from today starting at morning_time
-            today_images = get_image_files(date)
-            today_filtered_images = [img for img in today_images if datetime.fromtimestamp(os.path.getmtime(img)) >= start_time_morning]
+            today_images = get_image_files(date, config, min_mtime=start_ts)
 
             # Get images from tomorrow up to morning_time
-            tomorrow_images = get_image_files(date + timedelta(days=1))
-            tomorrow_filtered_images = [img for img in tomorrow_images if datetime.fromtimestamp(os.path.getmtime(img)) <= end_time_morning]
+            tomorrow_images = get_image_files(date + timedelta(days=1), config, max_mtime=end_ts)
 
             # Combine images from today and tomorrow
-            images = today_filtered_images + tomorrow_filtered_images
+            images = today_images + tomorrow_images
         else:
             # Get images from the selected date if morning-to-morning is not enabled
-            images = get_image_files(date)
+            images = get_image_files(date, config)
 
         if not images:
             log_with_color(f"No images found for the selected date: {date}", "error", "red")
             return
 
         # If test-amount is specified, limit the number of images
-        if args.test_amount:
-            log_with_color(f"Using only the first {args.test_amount} images for testing", "info", "magenta")
-            images = images[:args.test_amount]
-
-        # Create temporary file list for FFmpeg
-        image_list_file = create_ffmpeg_file_list(images)
+        if test_amount:
+            log_with_color(f"Using only the first {test_amount} images for testing", "info", "magenta")
+            images = images[:test_amount]
 
         # Define output path for video
-        output_folder = os.path.join(config['video_output']['folder'], date.strftime(config['video_output']['folder_structure']))
+        output_folder = os.path.join(vcfg.folder, date.strftime(vcfg.folder_structure))
         os.makedirs(output_folder, exist_ok=True)
 
         # Base filename before adding metadata
         base_filename = f"{config['filename']['prefix']}{date.strftime('%Y_%m_%d')}{config['filename']['suffix']}"
 
         # Append metadata if necessary
-        output_filename = append_metadata_to_filename(base_filename)
+        output_filename = append_metadata_to_filename(base_filename, config, vcfg)
 
         # Add file extension
         output_filename = f"{output_filename}{config['filename']['extension']}"
         output_path = os.path.join(output_folder, output_filename)
         
-        # Create FFmpeg command with progress output
-        ffmpeg_command = build_ffmpeg_command(image_list_file, output_path)
-        ffmpeg_command.extend(['-progress', '-', '-nostats'])
+        if can_encode_in_chunks(images, vcfg):
+            await encode_in_chunks(images, output_path, config, vcfg, position)
+        else:
+            # Read numbered sequences directly, fall back to the concat demuxer otherwise
+            sequence = find_image_sequence(images, config)
 
-        log_with_color(f"Running FFmpeg command: {' '.join(ffmpeg_command)}", "info", "cyan")
-        
-        # Run FFmpeg with progress bar
-        with subprocess.Popen(ffmpeg_command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT) as process:
-            parse_ffmpeg_progress(process, total_frames=len(images))
+            # The concat list never touches the disk: it goes into a memfd on Linux, or FFmpeg's stdin elsewhere
+            image_list_file, list_fd, list_payload = (None, None, None) if sequence else open_concat_list(images)
+
+            # Create FFmpeg command, with progress output only for encodes large enough to need it
+            show_progress = len(images) >= PROGRESS_MIN_FRAMES
+            ffmpeg_command = build_ffmpeg_command(image_list_file, output_path, vcfg, sequence)
+            if show_progress:
+                ffmpeg_command.extend(['-progress', '-', '-nostats'])
+
+            # Run FFmpeg with progress bar
+            process = await start_ffmpeg(ffmpeg_command, list_fd, list_payload, show_progress)
+            if show_progress:
+                await parse_ffmpeg_progress(process, total_frames=len(images), position=position)
+            if await process.wait() != 0:
+                raise RuntimeError(f"FFmpeg exited with status {process.returncode}")
 
         # End time and calculate duration
         end_time = datetime.now()
@@ -224,33 +542,92 @@ def create_timelapse(date):
                 "end_time": end_time.strftime("%Y-%m-%d %H:%M:%S"),
                 "number_of_images": len(images),
                 "image_input_folder": config['image_input']['folder'],
-                "video_filter": config['video_output']['video_filter'],
-                "codec": config['video_output']['codec'],
-                "crf": config['video_output']['crf'],
-                "preset": config['video_output']['preset'],
-                "bitrate": config['video_output']['max_bitrate'],
-                "video_size": config['video_output']['video_size'],
-                "test_amount": args.test_amount if args.test_amount else "full"
+                "video_filter": vcfg.video_filter,
+                "codec": vcfg.encoder,
+                "crf": vcfg.crf,
+                "preset": vcfg.preset,
+                "bitrate": vcfg.max_bitrate,
+                "video_size": vcfg.video_size,
+                "test_amount": test_amount if test_amount else "full"
             }
             # Save metadata to JSON
-            save_metadata_to_json(output_path, metadata)
+            save_metadata_to_json(output_path, metadata, config)
 
     except Exception as e:
         log_with_color(f"Error creating timelapse: {e}", "error", "red")
 
 
-# Argument parsing
-parser = ArgumentParser(description="Create a timelapse video from images")
-parser.add_argument('--date', type=str, help="Specify a date (YYYY-MM-DD) for timelapse")
-parser.add_argument('--test-amount', type=int, help="Limit the number of images to use for a quick test timelapse")
+# Create timelapses for several dates concurrently, supervising all FFmpeg processes from one event loop
+async def create_timelapses(dates, config, vcfg, test_amount=None):
+    cpu_count = os.cpu_count() or 1
+    threads_per_ffmpeg = config.get('parallel', {}).get('threads_per_ffmpeg', 2) or 0
+    if threads_per_ffmpeg < 1:
+        # 0 means auto: one concurrent encode per date, up to one per core
+        threads_per_ffmpeg = 0
+        max_workers = max(1, min(cpu_count, len(dates)))
+    else:
+        max_workers = max(1, min(cpu_count // threads_per_ffmpeg, len(dates)))
+    log_with_color(f"Creating {len(dates)} timelapses using {max_workers} concurrent encodes", "info", "green")
+
+    # Limit how many FFmpeg encodes run at once, and give each one its share of the cores
+    # unless video_output.threads is set explicitly
+    semaphore = asyncio.Semaphore(max_workers)
+    if not vcfg.threads:
+        vcfg = replace(vcfg, threads=max(threads_per_ffmpeg, cpu_count // max_workers, 1))
+
+    # Progress bar lines, one per concurrent encode, reused as dates finish
+    positions = asyncio.Queue()
+    for position in range(max_workers):
+        positions.put_nowait(position)
+
+    async def create_limited(date):
+        async with semaphore:
+            position = await positions.get()
+            try:
+                await create_timelapse(date, config, vcfg, test_amount, position)
+            finally:
+                positions.put_nowait(position)
+
+    await asyncio.gather(*(create_limited(date) for date in dates))
+
+
+def main():
+    # Load config.yaml
+    with open('config.yaml', 'r') as file:
+        config = yaml.safe_load(file)
+
+    setup_logging(config)
+
+    # Argument parsing
+    parser = ArgumentParser(description="Create a timelapse video from images")
+    date_group = parser.add_mutually_exclusive_group()
+    date_group.add_argument('--date', type=str, help="Specify a date (YYYY-MM-DD) for timelapse")
+    date_group.add_argument('--date-range', type=str, nargs=2, metavar=('START', 'END'), help="Create timelapses for every date from START to END (YYYY-MM-DD, inclusive)")
+    parser.add_argument('--test-amount', type=int, help="Limit the number of images to use for a quick test timelapse")
+
+    args = parser.parse_args()
+
+    # Resolve the video settings once, probing FFmpeg for the hardware encoder only after the arguments are valid
+    vcfg = VideoCfg.from_config(config)
+    vcfg = replace(vcfg, hw_codec=select_hw_codec(vcfg))
+
+    if args.date_range:
+        # Create one timelapse per date in the range
+        range_start, range_end = (datetime.strptime(d, '%Y-%m-%d').date() for d in args.date_range)
+        dates = [range_start + timedelta(days=i) for i in range((range_end - range_start).days + 1)]
+        if not dates:
+            parser.error("--date-range END must not be before START")
+        asyncio.run(create_timelapses(dates, config, vcfg, args.test_amount))
+    else:
+        # If no date is provided, use today's date
+        if args.date:
+            selected_date = datetime.strptime(args.date, '%Y-%m-%d').date()
+        else:
+            selected_date = datetime.today().date()
 
-args = parser.parse_args()
+        # Create the timelapse
+        asyncio.run(create_timelapse(selected_date, config, vcfg, args.test_amount))
 
-# If no date is provided, use today's date
-if args.date:
-    selected_date = datetime.strptime(args.date, '%Y-%m-%d').date()
-else:
-    selected_date = datetime.today().date()
 
-# Create the timelapse
-create_timelapse(selected_date)
+if __name__ == '__main__':
+    main()